@@ -1,9 +1,7 @@
 """Helper exports for the :mod:`modules` package."""
 
+from . import utils
 from .utils import *  # noqa: F401,F403
 from .vs_preview.view import Preview
 
-__all__ = [
-    name for name in globals().keys()
-    if not name.startswith('_')
-]
+__all__ = [*utils.__all__, "Preview"]
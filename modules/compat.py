@@ -2,37 +2,81 @@
 
 from __future__ import annotations
 
-from functools import partial, wraps
+from functools import lru_cache, partial, wraps
+from importlib.util import find_spec
 from typing import Optional
 
-try:  # pragma: no cover - optional dependency at runtime
-    from awsmfunc.types.placebo import PlaceboTonemapOpts
-except Exception:  # pragma: no cover - awsmfunc may not be available yet
-    PlaceboTonemapOpts = None  # type: ignore[assignment]
-
-try:  # pragma: no cover - optional dependency at runtime
+# Optional runtime dependencies. find_spec only checks import metadata, so a
+# missing package doesn't cost a raised and discarded ImportError.
+if find_spec("awsmfunc") is not None:  # pragma: no cover - optional dependency at runtime
     import awsmfunc
     from awsmfunc import base as awf_base
-except Exception:  # pragma: no cover - awsmfunc may not be available yet
+else:  # pragma: no cover - awsmfunc may not be available yet
     awsmfunc = None  # type: ignore[assignment]
     awf_base = None  # type: ignore[assignment]
 
-try:  # pragma: no cover - optional dependency at runtime
+if find_spec("vapoursynth") is not None:  # pragma: no cover - optional dependency at runtime
     import vapoursynth as vs
-except Exception:  # pragma: no cover - vapoursynth may not be available yet
+else:  # pragma: no cover - vapoursynth may not be available yet
     vs = None  # type: ignore[assignment]
 
 __all__ = [
     "UNSUPPORTED_TONEMAP_MARKERS",
+    "UNSUPPORTED_TONEMAP_PREFIX",
     "ensure_placebo_tonemap_compat",
     "ensure_frameinfo_compat",
 ]
 
+UNSUPPORTED_TONEMAP_PREFIX = "does not take argument"
 UNSUPPORTED_TONEMAP_MARKERS: tuple[str, ...] = (
-    "does not take argument(s) named",
-    "does not take argument named",
+    UNSUPPORTED_TONEMAP_PREFIX + "(s) named",
+    UNSUPPORTED_TONEMAP_PREFIX + " named",
 )
 
+# Set once ensure_frameinfo_compat has run, whatever the outcome
+_FRAMEINFO_PATCHED = False
+
+
+@lru_cache(maxsize=16)
+def _pict_line(pict_type: object) -> str:
+    """Return the FrameInfo picture-type line for a raw ``_PictType`` prop value."""
+
+    if isinstance(pict_type, bytes):
+        pict_display = pict_type.decode()
+    elif isinstance(pict_type, str):
+        pict_display = pict_type
+    elif pict_type is not None:
+        pict_display = str(pict_type)
+    else:
+        pict_display = "N/A"
+
+    return f"Picture type: {pict_display}"
+
+
+@lru_cache(maxsize=16)
+def _padding(newlines: int, pad_info: bool) -> tuple[Optional[str], str]:
+    """Return the ``(info, title)`` padding strings used by FrameInfo."""
+
+    if pad_info:
+        return " " + "\n" * newlines, " " + "\n" * (newlines + 4)
+
+    return None, " " + "\n" * newlines
+
+
+@lru_cache(maxsize=1)
+def _subtitle_accepts_str() -> bool:
+    """Probe whether ``sub.Subtitle`` takes ``text`` as a bare string rather than a list."""
+
+    core = vs.core
+    probe = core.std.BlankClip(width=16, height=16, length=1)
+
+    try:
+        core.sub.Subtitle(probe, text="probe")
+    except vs.Error:
+        return False
+
+    return True
+
 
 def ensure_placebo_tonemap_compat() -> None:
     """Reserved for future vs-placebo compatibility hooks."""
@@ -53,6 +97,13 @@ def ensure_placebo_tonemap_compat() -> None:
 def ensure_frameinfo_compat() -> None:
     """Make awsmfunc.FrameInfo tolerant of string frame props on Python 3.13."""
 
+    global _FRAMEINFO_PATCHED
+
+    if _FRAMEINFO_PATCHED:
+        return
+
+    _FRAMEINFO_PATCHED = True
+
     if awf_base is None or vs is None:
         return
 
@@ -62,11 +113,16 @@ def ensure_frameinfo_compat() -> None:
     if frameinfo is None or subtitle_style is None:
         return
 
+    # Still checked in case this module is imported under a second name (e.g. via PYTHONPATH)
     if getattr(awf_base.FrameInfo, "__compat_wrapped__", False):
         return
 
     core = vs.core
 
+    # Frame props expose a mapping API on API4 builds; resolve this once rather than per frame
+    frame_props_type = getattr(vs, "FrameProps", None)
+    props_have_get = frame_props_type is not None and hasattr(frame_props_type, "get")
+
     @wraps(frameinfo)
     def _compat_frameinfo(
         clip: "vs.VideoNode",
@@ -83,53 +139,58 @@ def ensure_frameinfo_compat() -> None:
             f: "vs.VideoFrame",
             clip: "vs.VideoNode",
             padding: Optional[str],
+            title_suffix: str = "",
         ) -> "vs.VideoNode":
             props = f.props
 
-            if hasattr(props, "get"):
+            if props_have_get:
                 pict_type = props.get("_PictType")
             elif "_PictType" in props:
                 pict_type = props["_PictType"]
             else:
                 pict_type = None
 
-            if isinstance(pict_type, bytes):
-                pict_display = pict_type.decode()
-            elif isinstance(pict_type, str):
-                pict_display = pict_type
-            elif pict_type is not None:
-                pict_display = str(pict_type)
-            else:
-                pict_display = "N/A"
-
-            if pict_display == "N/A":
-                pict_line = "Picture type: N/A"
-            else:
-                pict_line = f"Picture type: {pict_display}"
-
-            info = f"Frame {n} of {clip.num_frames}\n{pict_line}"
+            info = "".join((frame_prefix, str(n), frame_suffix, _pict_line(pict_type), title_suffix))
 
             if pad_info and padding:
-                info_text = [padding + info]
-            else:
-                info_text = [info]
-
-            return core.sub.Subtitle(clip, text=info_text, style=style)
-
-        padding_info: Optional[str] = None
-
-        if pad_info:
-            padding_info = " " + "".join(["\n"] * newlines)
-            padding_title = " " + "".join(["\n"] * (newlines + 4))
-        else:
-            padding_title = " " + "".join(["\n"] * newlines)
-
+                info = padding + info
+
+            return subtitle(clip, text=info if text_as_str else [info], style=style)
+
+        # Bound once so the per-frame callback skips the core.sub plugin lookup
+        subtitle = core.sub.Subtitle
+        text_as_str = _subtitle_accepts_str()
+        frame_prefix = "Frame "
+        frame_suffix = f" of {clip.num_frames}\n"
+        padding_info, padding_title = _padding(newlines, pad_info)
+
+        # Blank lines between the two-line frame info and the title, matching the
+        # positions awsmfunc gives them as separate overlays
+        title_gap = 3 if pad_info else newlines - 1
+
+        # Only merged for awsmfunc's own top-aligned style. Any other alignment would move the
+        # frame info along with the taller text block
+        if title_gap > 0 and style == subtitle_style:
+            # Render the title in the same Subtitle pass as the frame info
+            return core.std.FrameEval(
+                clip,
+                partial(
+                    _frame_props,
+                    clip=clip,
+                    padding=padding_info,
+                    title_suffix="\n" * title_gap + title,
+                ),
+                prop_src=clip,
+            )
+
+        # Custom styles, or a title overlapping the frame info, keep awsmfunc's separate overlays
         clip = core.std.FrameEval(
             clip,
             partial(_frame_props, clip=clip, padding=padding_info),
             prop_src=clip,
         )
-        clip = core.sub.Subtitle(clip, text=[padding_title + title], style=style)
+        title_text = padding_title + title
+        clip = subtitle(clip, text=title_text if text_as_str else [title_text], style=style)
 
         return clip
 
@@ -1,18 +1,23 @@
+import os
 import re
+import sys
 import vapoursynth as vs
 import awsmfunc as awf
-import math
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from functools import lru_cache
 from pathlib import Path
 from typing import Literal, Optional
 
 try:
     from .compat import (
         UNSUPPORTED_TONEMAP_MARKERS,
+        UNSUPPORTED_TONEMAP_PREFIX,
         ensure_frameinfo_compat,
         ensure_placebo_tonemap_compat,
     )
 except Exception:  # pragma: no cover - fallback for incomplete installs
+    UNSUPPORTED_TONEMAP_PREFIX = "does not take argument"
     UNSUPPORTED_TONEMAP_MARKERS = (
         "does not take argument(s) named",
         "does not take argument named",
@@ -24,6 +29,25 @@ except Exception:  # pragma: no cover - fallback for incomplete installs
     def ensure_placebo_tonemap_compat() -> None:
         return None
 
+__all__ = [
+    "LOAD",
+    "RESIZE",
+    "KERNELS",
+    "DITHER",
+    "SUFFIXES",
+    "DIMENSIONS",
+    "KERNEL_DICT",
+    "UNSUPPORTED_TONEMAP_MARKERS",
+    "ensure_frameinfo_compat",
+    "ensure_placebo_tonemap_compat",
+    "path_exists",
+    "verify_resize",
+    "crop_file",
+    "load_clips",
+    "prepare_clips",
+    "get_dimensions",
+]
+
 ensure_placebo_tonemap_compat()
 
 ensure_frameinfo_compat()
@@ -34,6 +58,24 @@ _HDR_TRANSFERS = {16, 18}
 _BT2020_PRIMARIES = 9
 _TRANSFER_PQ = 16
 _TRANSFER_HLG = 18
+# vs-placebo Tonemap src_csp values
+_SRC_CSP_HDR10 = 1
+_SRC_CSP_HLG = 2
+
+# Matches the argument list following any of the plugin's "unsupported argument" markers
+_UNSUPPORTED_KWARGS_RE = re.compile(
+    "(?:" + "|".join(re.escape(m) for m in UNSUPPORTED_TONEMAP_MARKERS) + r")\s*([^.]*)"
+)
+# Drops quoting/brackets and turns separators into spaces so a single split() yields the names
+_TONEMAP_ARG_STRIP = str.maketrans({"\n": " ", ",": " ", "'": "", '"': "", "(": "", ")": ""})
+# Parsed results keyed on the error message. The same message recurs for every clip
+_UNSUPPORTED_KWARGS_CACHE: dict[str, frozenset[str]] = {}
+# Tonemap arguments the installed vs-placebo rejected. Remembered so later clips skip them up front
+_UNSUPPORTED_TONEMAP_KWARGS: set[str] = set()
+# Argument-name sets a Tonemap call has already accepted. Failures with these can't be unsupported kwargs
+_GOOD_TONEMAP_SIGNATURES: set[frozenset[str]] = set()
+# Tonemap error messages already printed, so a failure repeated for every clip is reported once
+_REPORTED_TONEMAP_ERRORS: set[str] = set()
 
 
 @dataclass(frozen=True)
@@ -52,13 +94,17 @@ class _TonemapSettings:
 
 
 _TONEMAP_SETTINGS = _TonemapSettings()
+_REPORTED_TONEMAP_SETTINGS: set[_TonemapSettings] = set()
 
 # Type hints
 LOAD = Literal['ffm2', 'lsmas']
 RESIZE = Literal['720p', '1080p', '1440p', '2160p']
 KERNELS = Literal['bilinear', 'bicubic', 'point', 'lanczos', 'spline16', 'spline36', 'spline64']
+DITHER = Literal['none', 'ordered', 'random', 'error_diffusion']
 # Constants
 SUFFIXES = ['.mp4', '.mkv', '.m2ts', '.ts']
+# Cap on concurrent disk-bound source reads (indexing in load_clips, frame-0 decodes in prepare_clips)
+_MAX_SOURCE_WORKERS = 3
 DIMENSIONS = {
     '720p': [1280, 720],
     '1080p': [1920, 1080],
@@ -77,8 +123,9 @@ KERNEL_DICT = {
 
 
 def path_exists(path):
-    if Path(path).exists():
-        return Path(path)
+    path = Path(path)
+    if path.exists():
+        return path
     else:
         raise FileNotFoundError(f"The path: <{path}> does not exist")
 
@@ -101,14 +148,15 @@ def verify_resize(clips: list[vs.VideoNode],
 
     # Quick check to verify there aren't multiple different ARs
     if len(clips) > 2:
-        ars = set([(e.width / e.height) for e in clips[1:]])
+        ars = {e.width / e.height for e in clips[1:]}
         if len(ars) > 1:
             raise ValueError("Cannot process encoded clips with different aspect ratios")
 
     src_width, src_height = clips[0].width, clips[0].height
     enc_width, enc_height = clips[1].width, clips[1].height
 
-    kernel = KERNEL_DICT[kernel.lower()]
+    kernel_name = kernel.lower()
+    kernel = KERNEL_DICT[kernel_name]
 
     # Downscale. Try to account for column cropping
     if src_width - enc_width > 600:
@@ -136,9 +184,14 @@ def verify_resize(clips: list[vs.VideoNode],
     else:
         return clips[0]
 
+    # Already at the target resolution. Skip a no-op resize pass over the source, unless the
+    # caller passed resizer kwargs (e.g. format=) that still need applying
+    if not kwargs and src_width == resized_width and src_height == resized_height:
+        return clips[0]
+
     print(
         f"{type_scale} detected.\nSource dimensions: {src_width}x{src_height}"
-        f"\nEncode dimensions: {enc_width}x{enc_height}\nResizing kernel: {kernel}"
+        f"\nEncode dimensions: {enc_width}x{enc_height}\nResizing kernel: {kernel_name}"
     )
 
     return kernel(clip=clips[0], width=resized_width, height=resized_height, **kwargs)
@@ -159,23 +212,18 @@ def crop_file(clip: vs.VideoNode,
 
     src_width, src_height = clip.width, clip.height
 
-    top = bottom = math.ceil((src_height - height) / 2)
-    left = right = math.ceil((src_width - width) / 2)
-
-    # Meet requirement for mod cropping specified by mod_crop
-    while top % mod_crop != 0:
-        top += 1
-        bottom += 1
-
-    while right % mod_crop != 0:
-        right += 1
-        left += 1
+    # Split the difference evenly, rounding each side up to a multiple of mod_crop.
+    # ceil(ceil(d / 2) / mod) * mod == ceil(d / (2 * mod)) * mod for integers
+    top = bottom = -(-(src_height - height) // (2 * mod_crop)) * mod_crop
+    left = right = -(-(src_width - width) // (2 * mod_crop)) * mod_crop
 
-    print(f"Crop values:\nLeft: {left}\nRight: {right}\nTop: {top}\nBottom: {bottom}")
     dim_width = src_width - (left + right)
     dim_height = src_height - (top + bottom)
-    print(f"Input Dimensions: {src_width}x{src_height}")
-    print(f"Cropped Dimensions: {dim_width}x{dim_height}\n")
+    print(
+        f"Crop values:\nLeft: {left}\nRight: {right}\nTop: {top}\nBottom: {bottom}"
+        f"\nInput Dimensions: {src_width}x{src_height}"
+        f"\nCropped Dimensions: {dim_width}x{dim_height}\n"
+    )
 
     return core.std.Crop(clip, left, right, top, bottom)
 
@@ -206,23 +254,48 @@ def load_clips(files: list = None,
 
     if load_filter == 'ffms2':
         load_filter = core.ffms2.Source
-        suffix = '.ffindex'
+        index_suffix = '.ffindex'
     elif load_filter == 'lsmas':
         load_filter = core.lsmas.LWLibavSource
-        suffix = '.lwi'
+        index_suffix = '.lwi'
     else:
         raise ValueError("Unknown load filter specified. Options are 'ffms2' and 'lsmas'")
 
-    if folder and source_name:
-        print("\nLoading folder clips...")
-        files = [f for f in folder.iterdir() if f.suffix in SUFFIXES and f.stem != source_name]
-    elif folder and not source_name:
-        print("\nLoading folder clips...no source was provided. Attempting to guess based on file size")
-        # Try to guess what src is based on file size. Assumes same directory
-        src = max([f for f in folder.iterdir()], key=lambda x: x.stat().st_size)
-        files = [f for f in folder.iterdir() if f.suffix in SUFFIXES and f.stem != src.stem]
+    if folder:
+        # DirEntry caches stat results from the directory read, so list the folder only once
+        with os.scandir(folder) as it:
+            entries = list(it)
 
-    clips = [load_filter(f, cachefile=f.with_suffix(suffix)) for f in files]
+        if source_name:
+            print("\nLoading folder clips...")
+        else:
+            print("\nLoading folder clips...no source was provided. Attempting to guess based on file size")
+            # Try to guess what src is based on file size. Assumes same directory
+            source_name = Path(max(entries, key=lambda e: e.stat().st_size).name).stem
+
+        files = []
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            if ext in SUFFIXES and stem != source_name:
+                files.append(Path(entry.path))
+
+    cachefiles = [f.with_suffix(index_suffix) for f in files]
+
+    # Indexing an unindexed file scans all of it, and the source filters release the GIL while
+    # doing so. Index missing files side by side, but only a few at a time: the files usually
+    # share a disk, where many concurrent full-file reads would thrash it
+    missing = [i for i, cachefile in enumerate(cachefiles) if not cachefile.exists()]
+    clips: list[Optional[vs.VideoNode]] = [None] * len(files)
+
+    if len(missing) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(missing), _MAX_SOURCE_WORKERS)) as pool:
+            indexed = pool.map(lambda i: load_filter(files[i], cachefile=cachefiles[i]), missing)
+            for i, clip in zip(missing, indexed):
+                clips[i] = clip
+
+    for i, clip in enumerate(clips):
+        if clip is None:
+            clips[i] = load_filter(files[i], cachefile=cachefiles[i])
 
     return clips
 
@@ -230,7 +303,9 @@ def load_clips(files: list = None,
 def prepare_clips(clips: list[vs.VideoNode],
                   crop_dimensions: list[int, int],
                   clip_titles: list[str] = None,
-                  add_frame_info: bool = True) -> list[vs.VideoNode]:
+                  add_frame_info: bool = True,
+                  screenshot_mode: bool = False,
+                  dither_type: DITHER = 'error_diffusion') -> list[vs.VideoNode]:
 
     """
     Helper function used to prepare clips for comparison or screenshots.
@@ -239,49 +314,57 @@ def prepare_clips(clips: list[vs.VideoNode],
 
     - Crop files using provided dimensions
     - If input clips are HDR, tonemap them
-    - If titles were provided, zip them with their clips
+    - Pair clips with their titles, falling back to generic ones
     - If frame info overlays are desired, add them
 
     :param clips: Clips to process. The first clip should always be the source
     :param crop_dimensions: Dimensions used for cropping clips
     :param clip_titles: Titles for frame info overlays. The length of titles must match the length of clips
     :param add_frame_info: Boolean for adding frame info overlay. Default enabled
+    :param screenshot_mode: Set when only a few scattered frames will be rendered. Disables libplacebo's
+        dynamic peak detection, whose smoothing window would otherwise pull in neighbouring frames
+    :param dither_type: Dither used for the final RGB24 conversion. 'error_diffusion' is highest quality but
+        serial per row; 'ordered' is much cheaper and visually equivalent once tonemapped to 8-bit
     :return: List of prepared clips
     """
 
     # Crop clips
     clips = [crop_file(c, width=crop_dimensions[0], height=crop_dimensions[1]) for c in clips]
 
-    props = _first_frame_props(clips[0])
+    # Decode frame 0 once per clip and share its props with every conversion step. 8-bit clips
+    # can't be HDR and their RGB24 conversion reads the props itself, so they skip the decode.
+    # The decodes release the GIL, so run a few concurrently without thrashing a shared disk;
+    # graph building below stays in order so the console output does too
+    with ThreadPoolExecutor(max_workers=min(len(clips), _MAX_SOURCE_WORKERS)) as pool:
+        clip_props = list(pool.map(_high_depth_frame_props, clips))
 
-    if _is_hdr_clip(props):
+    if _is_hdr_clip(clips[0], clip_props[0]):
         _ensure_placebo_tonemap_support()
 
-        tonemapped_clips: list[vs.VideoNode] = []
-        for clip in clips:
-            tonemapped_clips.append(_process_hdr_clip(clip))
+        if screenshot_mode:
+            # Peak detection smooths over neighbouring frames, which scattered screenshots don't
+            # have. Fall back to the static HDR metadata libplacebo reads from the frame props
+            settings = replace(_TONEMAP_SETTINGS, dpd=False)
+        else:
+            settings = _TONEMAP_SETTINGS
 
-        clips = tonemapped_clips
+        clips = [
+            _process_hdr_clip(clip, props, settings, dither_type)
+            for clip, props in zip(clips, clip_props)
+        ]
     else:
-        clips = [_convert_to_rgb24(clip) for clip in clips]
+        clips = [_convert_to_rgb24(clip, props, dither_type) for clip, props in zip(clips, clip_props)]
 
-    # Zip together clips and titles if present
-    if clip_titles:
-        if len(clip_titles) != len(clips):
-            print("WARNING: The number of titles does not match the number of clips\n")
-            zipped = False
-        else:
-            clips = zip(clips, clip_titles)
-            zipped = True
-    else:
-        zipped = False
+    # Fall back to generic titles if none were given or they don't line up with the clips
+    if clip_titles and len(clip_titles) != len(clips):
+        print("WARNING: The number of titles does not match the number of clips\n")
+        clip_titles = None
+    if not clip_titles:
+        clip_titles = [f"Clip {i}" for i in range(len(clips))]
 
     # Add frame info overlay unless specified otherwise
-    if add_frame_info and zipped:
-        clips = list(clips)
-        clips = [awf.FrameInfo(c[0], c[1]) for c in clips]
-    elif add_frame_info:
-        clips = [awf.FrameInfo(c, f"Clip {i}") for i, c in enumerate(clips)]
+    if add_frame_info:
+        clips = [awf.FrameInfo(c, t) for c, t in zip(clips, clip_titles)]
     else:
         print("Frame overlay disabled")
 
@@ -315,8 +398,16 @@ def get_dimensions(resolution: str | int, clip: vs.VideoNode = None) -> list[int
         raise ValueError(f"Unknown resolution: {resolution}")
 
     if clip:
-        resized = awf.zresize(clip, preset=num)
-        dimensions = [resized.width, resized.height]
+        # Same rule as awf.zresize(clip, preset=num): wider than 16:9 fixes the width at the
+        # preset's 16:9 width, otherwise the height is fixed. The other side keeps the aspect
+        # ratio, rounded to mod 2. Computed directly so no resize node is built just to read it
+        if clip.width / clip.height > 16 / 9:
+            width = 16 / 9 * num
+            height = clip.height * width / clip.width
+        else:
+            height = num
+            width = clip.width * height / clip.height
+        dimensions = [round(width / 2) * 2, round(height / 2) * 2]
 
     return dimensions
 
@@ -326,18 +417,39 @@ def _ensure_placebo_tonemap_support() -> None:
 
     ensure_placebo_tonemap_compat()
 
-    placebo = getattr(core, "placebo", None)
-    tonemap = getattr(placebo, "Tonemap", None) if placebo else None
-
-    if tonemap is None:
+    if _placebo_tonemap() is None:
         raise RuntimeError(
             "HDR content detected but the vs-placebo plugin is not available. "
             "Install a recent vs-placebo build to enable libplacebo tonemapping."
         )
 
 
-def _first_frame_props(clip: vs.VideoNode) -> "vs.VideoFrameProps":
-    return clip.get_frame(0).props
+@lru_cache(maxsize=1)
+def _placebo_tonemap() -> Optional["vs.Function"]:
+    """Resolve ``core.placebo.Tonemap`` once; ``None`` if the plugin or function is missing."""
+
+    placebo = getattr(core, "placebo", None)
+    return getattr(placebo, "Tonemap", None) if placebo else None
+
+
+@lru_cache(maxsize=8)
+def _function_arg_names(signature: str) -> frozenset[str]:
+    """Parse a ``vs.Function.signature`` string (``"clip:vnode;src_csp:int:opt;..."``) into argument names."""
+
+    return frozenset(arg.split(":", 1)[0] for arg in signature.split(";") if arg)
+
+
+def _first_frame_props(clip: vs.VideoNode) -> dict:
+    # Copy the props out so the decoded frame is released as soon as we're done with it
+    with clip.get_frame(0) as frame:
+        return dict(frame.props)
+
+
+def _high_depth_frame_props(clip: vs.VideoNode) -> Optional[dict]:
+    # Steps that get None fetch the props themselves if they turn out to need them
+    if clip.format is not None and clip.format.bits_per_sample <= 8:
+        return None
+    return _first_frame_props(clip)
 
 
 def _read_prop(props: "vs.VideoFrameProps", key: str) -> Optional[int]:
@@ -368,7 +480,18 @@ def _read_prop(props: "vs.VideoFrameProps", key: str) -> Optional[int]:
         return None
 
 
-def _is_hdr_clip(props: "vs.VideoFrameProps") -> bool:
+def _is_hdr_clip(
+    clip: vs.VideoNode,
+    props: Optional["vs.VideoFrameProps"] = None,
+) -> bool:
+    # HDR10, HLG and Dolby Vision all need at least 10 bits. Rule 8-bit clips out from the
+    # format alone so their frame 0 never has to be decoded for this
+    if clip.format is not None and clip.format.bits_per_sample <= 8:
+        return False
+
+    if props is None:
+        props = _first_frame_props(clip)
+
     transfer = _read_prop(props, "_Transfer")
     primaries = _read_prop(props, "_Primaries")
 
@@ -383,9 +506,12 @@ def _convert_to_rgb48(
         props = _first_frame_props(clip)
 
     if clip.format is not None and clip.format.color_family == vs.RGB and clip.format.bits_per_sample == 16:
-        return clip
+        # Already RGB48; only make sure libplacebo reads it as full range RGB
+        return core.std.SetFrameProps(clip, _Matrix=0, _ColorRange=0)
 
-    resize_kwargs = {"format": vs.RGB48}
+    # Tag the output as full range RGB in the resize itself (as libplacebo expects) rather
+    # than adding a SetFrameProps node. Transfer and primaries carry over from the *_in values
+    resize_kwargs = {"format": vs.RGB48, "matrix_s": "rgb", "range_s": "full"}
 
     matrix = _read_prop(props, "_Matrix")
     transfer = _read_prop(props, "_Transfer")
@@ -407,18 +533,21 @@ def _convert_to_rgb48(
 def _convert_to_rgb24(
     clip: vs.VideoNode,
     props: Optional["vs.VideoFrameProps"] = None,
+    dither_type: DITHER = "error_diffusion",
 ) -> vs.VideoNode:
     if clip.format is not None and clip.format.color_family == vs.RGB and clip.format.bits_per_sample == 8:
         return clip
 
-    if props is None:
-        props = _first_frame_props(clip)
-
     resize_kwargs = {
         "format": vs.RGB24,
-        "dither_type": "error_diffusion",
+        "dither_type": dither_type,
     }
 
+    if props is None:
+        # resize falls back to the frame props for any *_in argument left unset, so there is
+        # no need to decode frame 0 here
+        return core.resize.Spline36(clip, **resize_kwargs)
+
     matrix = _read_prop(props, "_Matrix")
     transfer = _read_prop(props, "_Transfer")
     primaries = _read_prop(props, "_Primaries")
@@ -436,27 +565,9 @@ def _convert_to_rgb24(
     return core.resize.Spline36(clip, **resize_kwargs)
 
 
-def _normalize_props_for_placebo_rgb16(
-    clip: vs.VideoNode,
-    props: "vs.VideoFrameProps",
-) -> vs.VideoNode:
-    kwargs = {
-        "_Matrix": 0,
-        "_ColorRange": 0,
-    }
-
-    transfer = _read_prop(props, "_Transfer")
-    primaries = _read_prop(props, "_Primaries")
-
-    if transfer is not None:
-        kwargs["_Transfer"] = transfer
-    if primaries is not None:
-        kwargs["_Primaries"] = primaries
-
-    return core.std.SetFrameProps(clip, **kwargs)
-
-
 def _deduce_src_csp_from_props(props: "vs.VideoFrameProps") -> Optional[int]:
+    # Dolby Vision clips are deliberately treated as their PQ base layer here. vs-placebo's
+    # DoVi src_csp only accepts YUV input, and this pipeline hands Tonemap RGB48
     transfer = _read_prop(props, "_Transfer")
     primaries = _read_prop(props, "_Primaries")
 
@@ -464,65 +575,64 @@ def _deduce_src_csp_from_props(props: "vs.VideoFrameProps") -> Optional[int]:
         return None
 
     if transfer == _TRANSFER_PQ:
-        return 1
+        return _SRC_CSP_HDR10
     if transfer == _TRANSFER_HLG:
-        return 2
+        return _SRC_CSP_HLG
 
     return None
 
 
 def _extract_unsupported_tonemap_kwargs(message: str) -> set[str]:
-    unsupported: set[str] = set()
+    cached = _UNSUPPORTED_KWARGS_CACHE.get(message)
 
-    for marker in UNSUPPORTED_TONEMAP_MARKERS:
-        if marker not in message:
-            continue
-
-        suffix = message.split(marker, 1)[1]
-        suffix = suffix.strip()
+    if cached is None:
+        # Every marker shares the prefix, so a plain substring test rejects unrelated errors
+        if UNSUPPORTED_TONEMAP_PREFIX in message:
+            match = _UNSUPPORTED_KWARGS_RE.search(message)
+        else:
+            match = None
 
-        if "." in suffix:
-            suffix = suffix.split(".", 1)[0]
+        if match is None:
+            cached = frozenset()
+        else:
+            # Interned so set checks against the identifier-like kwarg names compare by identity
+            names = match.group(1).translate(_TONEMAP_ARG_STRIP).split()
+            cached = frozenset(map(sys.intern, names))
 
-        parts = re.split(r"[,\s]+", suffix)
+        _UNSUPPORTED_KWARGS_CACHE[message] = cached
 
-        for part in parts:
-            cleaned = part.strip("'\"")
+    return set(cached)
 
-            if cleaned:
-                unsupported.add(cleaned)
 
-        if unsupported:
-            break
+@lru_cache(maxsize=4)
+def _tonemap_prop(settings: _TonemapSettings) -> str:
+    return f"placebo:{settings.func},dpd={str(settings.dpd).lower()},dst_max={settings.dst_max}"
 
-    return unsupported
 
+def _apply_tonemap_props(clip: vs.VideoNode, settings: _TonemapSettings) -> vs.VideoNode:
+    clip = core.std.SetFrameProps(clip, _Tonemapped=_tonemap_prop(settings))
 
-def _apply_tonemap_props(clip: vs.VideoNode) -> vs.VideoNode:
-    settings = _TONEMAP_SETTINGS
-    tonemap_prop = (
-        f"placebo:{settings.func},dpd={str(settings.dpd).lower()},dst_max={settings.dst_max}"
-    )
-    clip = core.std.SetFrameProps(clip, _Tonemapped=tonemap_prop)
-    print(
-        "[libplacebo] HDR->SDR tonemap applied using function '",
-        f"{settings.func}' (dpd={settings.dpd}, dst_max={settings.dst_max}).",
-        sep="",
-    )
+    # Announce each tonemap configuration once per run rather than once per clip
+    if settings not in _REPORTED_TONEMAP_SETTINGS:
+        _REPORTED_TONEMAP_SETTINGS.add(settings)
+        print(
+            "[libplacebo] HDR->SDR tonemap applied using function '",
+            f"{settings.func}' (dpd={settings.dpd}, dst_max={settings.dst_max}).",
+            sep="",
+        )
     return clip
 
 
 def _tonemap_with_retries(
     clip: vs.VideoNode,
     src_csp_hint: Optional[int],
+    settings: _TonemapSettings = _TONEMAP_SETTINGS,
 ) -> vs.VideoNode:
-    placebo = getattr(core, "placebo", None)
-    tonemap = getattr(placebo, "Tonemap", None) if placebo else None
+    tonemap = _placebo_tonemap()
 
     if tonemap is None:
         raise RuntimeError("vs-placebo Tonemap is not available")
 
-    settings = _TONEMAP_SETTINGS
     base_kwargs = dict(
         dst_csp=0,
         dst_prim=1,
@@ -532,83 +642,110 @@ def _tonemap_with_retries(
         gamut_mapping=settings.gamut_mapping,
         tone_mapping_function_s=settings.func,
         use_dovi=True,
-        smoothing_period=settings.smoothing_period,
-        min_dynamic_peak=settings.min_dynamic_peak,
-        scene_threshold_low=settings.scene_threshold_low,
-        scene_threshold_high=settings.scene_threshold_high,
     )
+    # The smoothing and scene-change options only tune dynamic peak detection
+    if settings.dpd:
+        base_kwargs.update(
+            smoothing_period=settings.smoothing_period,
+            min_dynamic_peak=settings.min_dynamic_peak,
+            scene_threshold_low=settings.scene_threshold_low,
+            scene_threshold_high=settings.scene_threshold_high,
+        )
 
-    attempts: list[dict] = []
-    if src_csp_hint is not None:
-        attempt_kwargs = base_kwargs.copy()
-        attempt_kwargs["src_csp"] = src_csp_hint
-        attempts.append(attempt_kwargs)
-    attempts.append(base_kwargs)
-    forced_pq = base_kwargs.copy()
-    forced_pq["src_csp"] = 1
-    attempts.append(forced_pq)
+    # Strip arguments the plugin's declared signature doesn't list before the first call
+    arg_names = _function_arg_names(getattr(tonemap, "signature", None) or "")
+    if arg_names:
+        not_declared = (base_kwargs.keys() | {"src_csp"}) - arg_names - _UNSUPPORTED_TONEMAP_KWARGS
+        if not_declared:
+            _UNSUPPORTED_TONEMAP_KWARGS.update(not_declared)
+            print(
+                "[Tonemap compatibility] Skipping argument(s) not supported by vs-placebo: "
+                f"{', '.join(sorted(not_declared))}."
+            )
+
+    # base_kwargs is freshly built above, so drop rejected names in place rather than copying
+    for name in base_kwargs.keys() & _UNSUPPORTED_TONEMAP_KWARGS:
+        del base_kwargs[name]
 
-    last_exc: Optional[Exception] = None
-    removed_kwargs: set[str] = set()
-    index = 0
+    # Build the call the props call for. An src_csp taken from the props is the only correct
+    # one for HLG sources, so forced PQ is kept as a single last resort rather than tried up front
+    if src_csp_hint is not None and "src_csp" not in _UNSUPPORTED_TONEMAP_KWARGS:
+        base_kwargs["src_csp"] = src_csp_hint
 
-    while index < len(attempts):
-        kwargs = attempts[index]
+    kwargs = base_kwargs
+    tried_pq = False
 
+    # Retried when a plugin build without a signature rejects argument names, and once with
+    # forced PQ when the plugin rejects the hinted (or default) src_csp for any other reason
+    while True:
         try:
             tonemapped = tonemap(clip, **kwargs)
         except vs.Error as exc:
-            last_exc = exc
-            print(f"[Tonemap attempt {index + 1} failed] {exc}")
-
             message = str(exc)
-            unsupported = _extract_unsupported_tonemap_kwargs(message)
-            new_kwargs = {name for name in unsupported if name not in removed_kwargs}
-
-            if new_kwargs:
-                for name in sorted(new_kwargs):
-                    for attempt_kwargs in attempts:
-                        if name in attempt_kwargs:
-                            attempt_kwargs.pop(name, None)
-                    removed_kwargs.add(name)
-
-                names_display = ", ".join(sorted(new_kwargs))
-                print(
-                    "[Tonemap compatibility] Retrying without unsupported argument(s): "
-                    f"{names_display}."
-                )
-                index = 0
-                continue
-
-            index += 1
-            continue
-        else:
-            return _apply_tonemap_props(tonemapped)
 
-    if last_exc is not None:
-        raise last_exc
-
-    raise RuntimeError("Unknown error during tonemap attempts")
+            if message not in _REPORTED_TONEMAP_ERRORS:
+                _REPORTED_TONEMAP_ERRORS.add(message)
+                print(f"[Tonemap failed] {message}")
+
+            # Argument names already known to work can't be the problem
+            if frozenset(kwargs) not in _GOOD_TONEMAP_SIGNATURES:
+                new_kwargs = _extract_unsupported_tonemap_kwargs(message) - _UNSUPPORTED_TONEMAP_KWARGS
+
+                if new_kwargs:
+                    for name in kwargs.keys() & new_kwargs:
+                        del kwargs[name]
+                    _UNSUPPORTED_TONEMAP_KWARGS.update(new_kwargs)
+
+                    print(
+                        "[Tonemap compatibility] Retrying without unsupported argument(s): "
+                        f"{', '.join(sorted(new_kwargs))}."
+                    )
+                    continue
+
+            if (
+                tried_pq
+                or "src_csp" in _UNSUPPORTED_TONEMAP_KWARGS
+                or kwargs.get("src_csp") == _SRC_CSP_HDR10
+            ):
+                raise
+
+            tried_pq = True
+            kwargs["src_csp"] = _SRC_CSP_HDR10
+            print("[Tonemap compatibility] Retrying with src_csp forced to PQ.")
+        else:
+            _GOOD_TONEMAP_SIGNATURES.add(frozenset(kwargs))
+            return _apply_tonemap_props(tonemapped, settings)
 
 
-def _finalize_rgb24(clip: vs.VideoNode) -> vs.VideoNode:
-    return core.resize.Spline36(
+def _finalize_rgb24(clip: vs.VideoNode, dither_type: DITHER = "error_diffusion") -> vs.VideoNode:
+    # RGB48 -> RGB24 at the same size is a depth conversion only, so no resampling kernel is involved.
+    # The RGB48 stage itself can't be skipped: vs-placebo's Tonemap only takes 16-bit RGB/YUV input
+    return core.resize.Point(
         clip,
         format=vs.RGB24,
-        dither_type="error_diffusion",
+        dither_type=dither_type,
     )
 
 
-def _process_hdr_clip(clip: vs.VideoNode) -> vs.VideoNode:
-    props = _first_frame_props(clip)
+def _process_hdr_clip(
+    clip: vs.VideoNode,
+    props: Optional["vs.VideoFrameProps"] = None,
+    settings: _TonemapSettings = _TONEMAP_SETTINGS,
+    dither_type: DITHER = "error_diffusion",
+) -> vs.VideoNode:
+    if props is None:
+        props = _first_frame_props(clip)
 
     try:
         rgb16 = _convert_to_rgb48(clip, props)
-        normalized = _normalize_props_for_placebo_rgb16(rgb16, props)
         src_csp_hint = _deduce_src_csp_from_props(props)
-        tonemapped = _tonemap_with_retries(normalized, src_csp_hint)
+        # Tonemap whole frames. vs-placebo runs on the GPU through Vulkan, so splitting the
+        # frame into CropAbs/StackHorizontal strips wouldn't improve cache use; it would only
+        # multiply uploads and dispatches and break frame-wide peak detection
+        tonemapped = _tonemap_with_retries(rgb16, src_csp_hint, settings)
     except Exception as exc:
         print(f"[ERROR] Color processing failed ({exc}). Falling back to SDR conversion.")
-        return _convert_to_rgb24(clip, props)
+        return _convert_to_rgb24(clip, props, dither_type)
+
+    return _finalize_rgb24(tonemapped, dither_type)
 
-    return _finalize_rgb24(tonemapped)
@@ -39,10 +39,13 @@ import vapoursynth as vs
 import awsmfunc as awf
 
 import argparse
+import os
 import re
-import random
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import numpy as np
+
 from modules import (
     path_exists,
     verify_resize,
@@ -60,6 +63,9 @@ except ImportError:
 
 core = vs.core
 
+# First letter of a screenshot file name, i.e. its tag
+_TAG_PATTERN = re.compile("[A-Za-z]")
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -98,6 +104,10 @@ def parse_args():
                         help="Filter used to load & index clips. Default is 'ffms2'")
     parser.add_argument('--no_frame_info', '-ni', action='store_false',
                         help="Don't add frame info overlay to clips. This flag negates the default behavior")
+    parser.add_argument('--dither_type', '-dt', type=str, choices=('none', 'ordered', 'random', 'error_diffusion'),
+                        default='ordered',
+                        help="Dither used when converting to 8-bit RGB. Default is 'ordered'; "
+                             "'error_diffusion' is slightly higher quality but much slower")
 
     args = parser.parse_args()
     print("------------------------ START ------------------------")
@@ -124,15 +134,22 @@ def parse_args():
 
     # Load clips from directory
     if args.input_directory:
+        # DirEntry caches stat results from the directory read, so list the folder only once
+        with os.scandir(root) as it:
+            entries = list(it)
         if no_src:
             # Try to guess what src is based on file size. Assumes same directory
             print("Loading folder clips...no source was provided. Attempting to guess based on file size")
-            src_name = max([f for f in root.iterdir()], key=lambda x: x.stat().st_size).stem
+            src_name = Path(max(entries, key=lambda e: e.stat().st_size).name).stem
             print(f"Source (best guess): {src_name}\n")
         else:
             print("Loading folder clips...")
             src_name = args.source.stem
-        args.encodes = [f for f in root.iterdir() if f.suffix in SUFFIXES and f.stem != src_name]
+        args.encodes = []
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            if ext in SUFFIXES and stem != src_name:
+                args.encodes.append(Path(entry.path))
 
     # Try to create output directory if passed. Else, use root
     if args.output_directory and not args.output_directory.exists():
@@ -143,7 +160,8 @@ def parse_args():
             args.output_directory = root / f'screens-offset_{args.offset}'
     elif not args.output_directory:
         # don't overwrite
-        screen_count = sum(1 for d in root.iterdir() if d.is_dir() and 'screens' in d.stem)
+        with os.scandir(root) as it:
+            screen_count = sum(1 for d in it if d.is_dir() and 'screens' in Path(d.name).stem)
         args.output_directory = root / f'screens t{screen_count + 1}-offset_{args.offset}'
         args.output_directory.mkdir(parents=True, exist_ok=True)
 
@@ -176,6 +194,7 @@ def parse_args():
             args.random_frames,
             args.offset,
             args.load_filter[0] if type(args.load_filter) is list else args.load_filter,
+            args.dither_type,
             no_src)
 
 
@@ -195,7 +214,11 @@ def generate_screenshots(clips: list[vs.VideoNode],
     :return: Void
     """
 
-    chars = []
+    # parse_args doesn't always create the folder. Create it here so the concurrent ScreenGen
+    # calls below don't race on their own mkdir
+    folder.mkdir(parents=True, exist_ok=True)
+
+    chars = set()
     clip_len = len(clips)
 
     if offset:
@@ -204,15 +227,16 @@ def generate_screenshots(clips: list[vs.VideoNode],
         src_frames = frames
 
     # Generate tags. Increment chars to prevent overwriting
-    for file in folder.iterdir():
-        if file.suffix in ('.jpg', '.jpeg', '.png'):
-            char = ord(re.search("[A-Za-z]", file.name)[0])
-            if char and char not in chars:
-                chars.append(char)
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.name.endswith(('.jpg', '.jpeg', '.png')):
+                match = _TAG_PATTERN.search(entry.name)
+                if match:
+                    chars.add(ord(match[0]))
     if len(chars) == 0:
         tags = [chr(ord('a') + c) for c in range(0, clip_len)]
     else:
-        tags = [chr(c + clip_len) for c in chars]
+        tags = [chr(c + clip_len) for c in sorted(chars)]
         if len(tags) < clip_len:
             difference = clip_len - len(tags)
             for i in range(1, difference + 1):
@@ -220,11 +244,23 @@ def generate_screenshots(clips: list[vs.VideoNode],
                 tags.append(chr(ord(last) + 1))
 
     # screenshots for source. Pop src tag to prevent conflict
+    jobs = []
     if not no_source:
-        awf.ScreenGen(clips[0], folder, tags[0], frame_numbers=src_frames)
-        tags.pop(0)
+        jobs.append((clips[0], tags.pop(0), src_frames))
     for i, clip in enumerate(clips[1:]):
-        awf.ScreenGen(clip, folder, tags[i], frame_numbers=frames)
+        jobs.append((clip, tags[i], frames))
+
+    # ScreenGen requests one frame at a time and blocks on it. Running the clips side by side
+    # keeps VapourSynth's thread pool busy with several frame requests at once. Their per-frame
+    # progress lines would overwrite each other, so print one line per clip instead
+    with ThreadPoolExecutor(max_workers=max(len(jobs), 1)) as pool:
+        futures = [
+            pool.submit(awf.ScreenGen, clip, folder, tag, frame_numbers=clip_frames, callback=False)
+            for clip, tag, clip_frames in jobs
+        ]
+        for future, (_, tag, clip_frames) in zip(futures, jobs):
+            future.result()
+            print(f"ScreenGen: Wrote {len(clip_frames)} screenshot(s) with suffix '{tag}'")
 
 
 def generate_random_frames(clips: list[vs.VideoNode],
@@ -241,16 +277,17 @@ def generate_random_frames(clips: list[vs.VideoNode],
     """
 
     # Get the smallest number of frames for all clips
-    frame_count = min([c.num_frames for c in clips])
+    frame_count = min(c.num_frames for c in clips)
     if frame_range[0] > frame_count:
         raise ValueError("random_frames: Start frame is greater than the smallest clip's end frame.")
 
     # Handle out-of-bounds errors if stop is greater than frame count
     stop = frame_range[1] if frame_range[1] < frame_count - 5 else frame_count - 5
-    rand_frames = random.sample(range(frame_range[0], stop), frame_range[2])
-    rand_frames.sort()
+    # Sample offsets without materialising the whole range, then shift back to frame numbers
+    rng = np.random.default_rng()
+    rand_frames = np.sort(rng.choice(stop - frame_range[0], size=frame_range[2], replace=False))
 
-    return rand_frames
+    return (rand_frames + frame_range[0]).tolist()
 
 
 def main():
@@ -264,6 +301,7 @@ def main():
      rand_frames,
      offset,
      load_filter,
+     dither_type,
      no_source) = parse_args()
 
     if no_source:
@@ -302,7 +340,9 @@ def main():
         'clips': clips,
         'crop_dimensions': crop,
         'clip_titles': titles if titles else None,
-        'add_frame_info': overlay
+        'add_frame_info': overlay,
+        'screenshot_mode': True,
+        'dither_type': dither_type
     }
     clips = prepare_clips(**kwargs)
 